@@ -22,20 +22,36 @@ import gradio as gr
 import os
 import sys
 import platform
-from datetime import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import time
 import shutil
 from pathlib import Path
 import soundfile as sf
 from pydub import AudioSegment
 import torch
 import numpy as np
-from typing import Union, List, Optional, Tuple
+from typing import Union, List, Optional, Tuple, Iterator, Callable
 from models import (
     list_available_voices, build_model,
-    generate_speech, download_voice_files
+    generate_speech, download_voice_files,
+    compile_pipeline_model, warmup_pipeline,
+    inference_context, preload_voices, clear_voice_cache,
+    configure_torch_runtime, split_text_segments,
+    logger, enable_g2p_cache, prime_g2p_cache,
+    to_pcm16
 )
 from kokoro import KPipeline
 
+# Optional in-process MP3 encoder; pydub/ffmpeg is used when it is missing
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+    print("Note: lameenc not installed, MP3 export will use pydub/ffmpeg")
+
 # Define path type for consistent handling
 PathLike = Union[str, Path]
 
@@ -52,9 +68,22 @@ def validate_sample_rate(rate: int) -> int:
 CONFIG_FILE = Path("tts_config.json")  # Stores user preferences and paths
 DEFAULT_OUTPUT_DIR = Path("outputs")    # Directory for generated audio files
 SAMPLE_RATE = validate_sample_rate(24000)  # Validated sample rate
+SAMPLES_PER_CHAR_ESTIMATE = SAMPLE_RATE // 12  # Roughly 12 characters of speech per second
+VOICE_PRELOAD_COUNT = 4  # Number of voices loaded into memory at startup
+MAX_CONCURRENT_REQUESTS = 8  # Requests handled at once; generation itself runs one at a time
+
+# Single worker that owns the shared KModel; every generation runs on it in
+# submission order, so the model is never called from two threads at once
+_GENERATION_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-generate")
+
+# Output file naming: process start time plus a per-request counter keeps names
+# unique even when several requests finish within the same second
+_OUTPUT_EPOCH = int(time.time())
+_OUTPUT_COUNTER = itertools.count()
 
 # Initialize model globally
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
+configure_torch_runtime(device)
 model = None
 
 LANG_MAP = {
@@ -69,17 +98,20 @@ LANG_MAP = {
     "pf_": "p", "pm_": "p",
 }
 pipelines = {}
+model_ready = threading.Event()  # Set once the background model load has finished
 
 def get_available_voices():
     """Get list of available voice models."""
     try:
-        # Initialize model to trigger voice downloads
+        # Only initialize the model here when voices still need downloading;
+        # otherwise it is loaded in the background by create_interface
         global model
-        if model is None:
+        voices = list_available_voices()
+        if not voices and model is None:
             print("Initializing model and downloading voices...")
             model = build_model(None, device)
+            voices = list_available_voices()
         
-        voices = list_available_voices()
         if not voices:
             print("No voices found after initialization. Attempting to download...")
             download_voice_files()  # Try downloading again
@@ -91,24 +123,104 @@ def get_available_voices():
         print(f"Error getting voices: {e}")
         return []
     
+def _load_global_model(voices: List[str]) -> None:
+    """Load the model, preload voices and warm up pipelines, then signal readiness."""
+    global model
+    try:
+        if model is None:
+            print("Loading model in the background...")
+            model = build_model(None, device)
+        
+        # Preload the first few voices and warm up the models before serving
+        preloaded = preload_voices(voices[:VOICE_PRELOAD_COUNT], device)
+        print(f"Preloaded {preloaded} voices")
+        warmup_pipelines(voices[0])
+        
+        # Phonemize common English phrases so early requests hit the G2P cache
+        for pipeline in [model] + [pipelines[code] for code in ("a", "b") if code in pipelines]:
+            prime_g2p_cache(pipeline)
+        print("Model ready")
+    except Exception as e:
+        print(f"Error loading model in the background: {type(e).__name__}: {e}")
+    finally:
+        # Always release waiting requests; they retry the load themselves on failure
+        model_ready.set()
+
+def get_model_status() -> str:
+    """Describe whether the model has finished loading, for display in the UI."""
+    if model_ready.is_set():
+        return "Model ready."
+    return "Model is warming up. The first request will start once loading finishes."
+
+def refresh_model_status() -> Tuple[str, "gr.Timer"]:
+    """Return the current status and stop the polling timer once the model is ready."""
+    return get_model_status(), gr.Timer(active=not model_ready.is_set())
+
+def get_lang_code(voice_name: str) -> str:
+    """Determine the language code from the voice prefix."""
+    return LANG_MAP.get(voice_name[:3].lower(), "a")
+
 def get_pipeline_for_voice(voice_name: str) -> KPipeline:
     """
     Determine the language code from the voice prefix and return the associated pipeline.
     """
-    prefix = voice_name[:3].lower()
-    lang_code = LANG_MAP.get(prefix, "a")
+    global model
+    lang_code = get_lang_code(voice_name)
     if lang_code not in pipelines:
-        print(f"[INFO] Creating pipeline for lang_code='{lang_code}'")
-        pipelines[lang_code] = KPipeline(lang_code=lang_code, model=True)
+        if model is None:
+            model = build_model(None, device)
+        if getattr(model, 'lang_code', None) == lang_code:
+            # The global pipeline already serves this language
+            pipelines[lang_code] = model
+        else:
+            # Share the global KModel so each language only adds its G2P frontend
+            logger.info("Creating pipeline for lang_code='%s'", lang_code)
+            pipelines[lang_code] = KPipeline(lang_code=lang_code, model=model.model)
+            compile_pipeline_model(pipelines[lang_code], device)
+            enable_g2p_cache(pipelines[lang_code])
     return pipelines[lang_code]
 
-def convert_audio(input_path: PathLike, output_path: PathLike, format: str) -> Optional[PathLike]:
+def warmup_pipelines(voice_name: str) -> None:
+    """Warm up the models used for a voice so the first request skips compilation."""
+    voice_path = Path("voices").absolute() / f"{voice_name}.pt"
+    if not voice_path.exists():
+        return
+    print(f"Warming up pipelines with voice: {voice_name}")
+    if model is not None:
+        warmup_pipeline(model, voice_path)
+    if voice_name.startswith(tuple(LANG_MAP.keys())):
+        pipeline = get_pipeline_for_voice(voice_name)
+        if pipeline is not model:
+            warmup_pipeline(pipeline, voice_path)
+
+def encode_mp3(audio_data: np.ndarray, output_path: PathLike, bitrate: int = 192) -> None:
+    """Encode mono audio to MP3 in-process with lameenc.
+    
+    Args:
+        audio_data: Mono int16 PCM, or float audio in the range [-1, 1]
+        output_path: Path to output MP3 file
+        bitrate: Bitrate in kbps
+    """
+    pcm = to_pcm16(audio_data)
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(bitrate)
+    encoder.set_in_sample_rate(SAMPLE_RATE)
+    encoder.set_channels(1)
+    encoder.set_quality(2)  # 2 = high quality
+    mp3_data = encoder.encode(pcm.tobytes()) + encoder.flush()
+    with open(output_path, "wb") as f:
+        f.write(mp3_data)
+
+def convert_audio(input_path: PathLike, output_path: PathLike, format: str,
+                  audio_data: Optional[np.ndarray] = None) -> Optional[PathLike]:
     """Convert audio to specified format.
     
     Args:
         input_path: Path to input audio file
         output_path: Path to output audio file
         format: Output format ('wav', 'mp3', or 'aac')
+        audio_data: Optional in-memory copy of the audio; lets MP3 be encoded
+            without re-reading the WAV or spawning ffmpeg
         
     Returns:
         Path to output file or None on error
@@ -129,6 +241,13 @@ def convert_audio(input_path: PathLike, output_path: PathLike, format: str) -> O
         # Create output directory if it doesn't exist
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
+        # Encode MP3 in-process when the audio is already in memory
+        if format.lower() == "mp3" and lameenc is not None and audio_data is not None:
+            encode_mp3(audio_data, output_path)
+            if not output_path.exists() or output_path.stat().st_size == 0:
+                raise IOError(f"Failed to create {format} file")
+            return output_path
+        
         # Convert format
         audio = AudioSegment.from_wav(str(input_path))
         
@@ -155,20 +274,110 @@ def convert_audio(input_path: PathLike, output_path: PathLike, format: str) -> O
         traceback.print_exc()
         return None
 
-def generate_tts_with_logs(voice_name: str, text: str, format: str) -> Optional[PathLike]:
-    """Generate TTS audio with progress logging.
+def _allocate_audio_buffer(num_samples: int) -> torch.Tensor:
+    """Allocate a float32 CPU buffer for output audio."""
+    return torch.empty(num_samples, dtype=torch.float32)
+
+def _write_segment(buffer: torch.Tensor, cursor: int, segment: torch.Tensor) -> Tuple[torch.Tensor, int]:
+    """Copy an audio segment into the output buffer, growing the buffer if needed.
+    
+    Args:
+        buffer: Pre-allocated output buffer
+        cursor: Number of samples already written to the buffer
+        segment: Audio segment to append
+        
+    Returns:
+        Tuple of (buffer, new cursor); the buffer is a new tensor if it had to grow
+    """
+    segment = segment.reshape(-1)
+    end = cursor + segment.shape[0]
+    if end > buffer.shape[0]:
+        grown = _allocate_audio_buffer(max(buffer.shape[0] * 2, end))
+        grown[:cursor].copy_(buffer[:cursor])
+        buffer = grown
+    buffer[cursor:end].copy_(segment)
+    return buffer, end
+
+def synthesize_speech(voice_name: str, voice_path: PathLike, segments: List[str], text_length: int,
+                      on_segment: Optional[Callable[[np.ndarray], None]] = None) -> torch.Tensor:
+    """Run the pipeline for a voice over pre-split text segments.
+    
+    Args:
+        voice_name: Name of the voice to use
+        voice_path: Path to the voice file
+        segments: Text segments to synthesize
+        text_length: Length of the original text, used to pre-size the output buffer
+        on_segment: Optional callback receiving each segment as a float32 array
+            as soon as it is generated
+        
+    Returns:
+        Float32 CPU tensor with the audio for all segments
+    """
+    try:
+        if voice_name.startswith(tuple(LANG_MAP.keys())):
+            pipeline = get_pipeline_for_voice(voice_name)
+        else:
+            pipeline = model
+        generator = pipeline(segments, voice=voice_path, speed=1.0)
+        
+        # Pre-size the output buffer from the text length; it grows if the estimate is short
+        audio_buffer = _allocate_audio_buffer(max(text_length, 1) * SAMPLES_PER_CHAR_ESTIMATE)
+        cursor = 0
+        max_segments = 100  # Safety limit for very long texts
+        segment_count = 0
+        
+        # The pipeline is a lazy generator, so inference runs inside this loop
+        with inference_context(device):
+            for gs, ps, audio in generator:
+                segment_count += 1
+                if segment_count > max_segments:
+                    print(f"Warning: Reached maximum segment limit ({max_segments})")
+                    break
+                    
+                if audio is not None:
+                    if isinstance(audio, np.ndarray):
+                        audio = torch.from_numpy(audio)
+                    # Copying into the float32 buffer also casts autocast output back to FP32
+                    audio_buffer, cursor = _write_segment(audio_buffer, cursor, audio)
+                    if on_segment is not None:
+                        if audio.device.type != 'cpu' or audio.dtype != torch.float32:
+                            audio = audio.to('cpu', torch.float32)
+                        on_segment(audio.numpy())
+                    logger.debug("Generated segment: %s", gs)
+                    if ps:  # Only log phonemes if available
+                        logger.debug("Phonemes: %s", ps)
+        
+        if cursor == 0:
+            raise Exception("No audio generated")
+        if hasattr(getattr(pipeline, 'g2p', None), 'cache_info'):
+            logger.debug("G2P cache: %s", pipeline.g2p.cache_info())
+    except Exception as e:
+        raise Exception(f"Error in speech generation: {e}")
+        
+    return audio_buffer[:cursor]
+
+
+def generate_tts_with_logs(voice_name: str, text: str, format: str) -> Iterator[Tuple]:
+    """Generate TTS audio with progress logging, streaming segments as they finish.
     
     Args:
         voice_name: Name of the voice to use
         text: Text to convert to speech
         format: Output format ('wav', 'mp3', 'aac')
         
-    Returns:
-        Path to generated audio file or None on error
+    Yields:
+        (stream chunk, file path) pairs for the live preview and file outputs.
+        Segments are streamed as (sample rate, audio) tuples first, then the
+        path to the generated audio file (or None on error) is yielded last.
     """
     global model
     
     try:
+        # Wait for the background load started by create_interface
+        if not model_ready.is_set():
+            print("Waiting for model to finish loading...")
+            model_ready.wait()
+        
         # Initialize model if needed
         if model is None:
             print("Initializing model...")
@@ -187,9 +396,8 @@ def generate_tts_with_logs(voice_name: str, text: str, format: str) -> Optional[
             print(f"Warning: Text exceeds {MAX_CHARS} characters. Truncating to prevent memory issues.")
             text = text[:MAX_CHARS] + "..."
         
-        # Generate base filename from text
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_name = f"tts_{timestamp}"
+        # Generate a unique base filename for this request
+        base_name = f"tts_{voice_name}_{_OUTPUT_EPOCH}_{next(_OUTPUT_COUNTER)}"
         wav_path = DEFAULT_OUTPUT_DIR / f"{base_name}.wav"
         
         # Generate speech
@@ -201,67 +409,46 @@ def generate_tts_with_logs(voice_name: str, text: str, format: str) -> Optional[
         if not voice_path.exists():
             raise FileNotFoundError(f"Voice file not found: {voice_path}")
             
-        try:
-            if voice_name.startswith(tuple(LANG_MAP.keys())):
-                pipeline = get_pipeline_for_voice(voice_name)
-                generator = pipeline(text, voice=voice_path, speed=1.0, split_pattern=r'\n+')
-            else:
-                generator = model(text, voice=voice_path, speed=1.0, split_pattern=r'\n+')
-            
-            all_audio = []
-            max_segments = 100  # Safety limit for very long texts
-            segment_count = 0
+        # Split up front so input with no speakable segments is rejected before
+        # it is queued; the pipeline receives the same segments it would produce
+        segments = split_text_segments(text)
+        if not segments:
+            raise ValueError("Text input contains no speakable segments")
             
-            for gs, ps, audio in generator:
-                segment_count += 1
-                if segment_count > max_segments:
-                    print(f"Warning: Reached maximum segment limit ({max_segments})")
-                    break
-                    
-                if audio is not None:
-                    if isinstance(audio, np.ndarray):
-                        audio = torch.from_numpy(audio).float()
-                    all_audio.append(audio)
-                    print(f"Generated segment: {gs}")
-                    if ps:  # Only print phonemes if available
-                        print(f"Phonemes: {ps}")
-            
-            if not all_audio:
-                raise Exception("No audio generated")
-        except Exception as e:
-            raise Exception(f"Error in speech generation: {e}")
-            
-        # Combine audio segments and save
-        if not all_audio:
-            raise Exception("No audio segments were generated")
-            
-        # Handle single segment case without concatenation
-        if len(all_audio) == 1:
-            final_audio = all_audio[0]
-        else:
+        # Run generation on the model's worker thread and stream each segment
+        # to the browser as soon as it is generated
+        chunks = queue.Queue()
+        future = _GENERATION_EXECUTOR.submit(synthesize_speech, voice_name, voice_path, segments, len(text), chunks.put)
+        while not (future.done() and chunks.empty()):
             try:
-                final_audio = torch.cat(all_audio, dim=0)
-            except RuntimeError as e:
-                raise Exception(f"Failed to concatenate audio segments: {e}")
+                chunk = chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            yield (SAMPLE_RATE, chunk), gr.update()
+        final_audio = future.result()
                 
-        # Save audio file
+        # Convert to 16-bit PCM once; the same buffer feeds the MP3 encoder
+        pcm = to_pcm16(final_audio.numpy())
         try:
-            sf.write(wav_path, final_audio.numpy(), SAMPLE_RATE)
+            sf.write(wav_path, pcm, SAMPLE_RATE, subtype="PCM_16")
         except Exception as e:
             raise Exception(f"Failed to save audio file: {e}")
         
-        # Convert to requested format if needed
+        # Return the WAV right away so it can be played while any conversion runs
+        yield gr.update(), wav_path
+        
+        # Convert to requested format, then swap in the converted file
         if format.lower() != "wav":
             output_path = DEFAULT_OUTPUT_DIR / f"{base_name}.{format.lower()}"
-            return convert_audio(wav_path, output_path, format.lower())
-        
-        return wav_path
+            converted_path = convert_audio(wav_path, output_path, format.lower(), pcm)
+            if converted_path is not None:
+                yield gr.update(), converted_path
         
     except Exception as e:
         print(f"Error generating speech: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        yield None, None
 
 def create_interface(server_name="0.0.0.0", server_port=7860):
     """Create and launch the Gradio interface."""
@@ -272,9 +459,14 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
         print("No voices found! Please check the voices directory.")
         return
         
+    # Load the model off the startup path so the UI is served immediately
+    threading.Thread(target=_load_global_model, args=(voices,), name="model-loader", daemon=True).start()
+        
     # Create interface
     with gr.Blocks(title="Kokoro TTS Generator") as interface:
         gr.Markdown("# Kokoro TTS Generator")
+        status = gr.Markdown(get_model_status())
+        status_timer = gr.Timer(1.0, active=not model_ready.is_set())
         
         with gr.Row():
             with gr.Column():
@@ -296,14 +488,20 @@ def create_interface(server_name="0.0.0.0", server_port=7860):
                 generate = gr.Button("Generate Speech")
             
             with gr.Column():
+                stream_output = gr.Audio(label="Live Preview", streaming=True, autoplay=True)
                 output = gr.Audio(label="Generated Audio")
                 
         generate.click(
             fn=generate_tts_with_logs,
             inputs=[voice, text, format],
-            outputs=output
+            outputs=[stream_output, output],
+            concurrency_limit=MAX_CONCURRENT_REQUESTS
         )
         
+        # Refresh the loading status on page open and poll until loading finishes
+        interface.load(fn=refresh_model_status, outputs=[status, status_timer])
+        status_timer.tick(fn=refresh_model_status, outputs=[status, status_timer])
+        
     # Launch interface
     interface.launch(
         server_name=server_name,
@@ -337,6 +535,12 @@ def cleanup_resources():
                 except Exception as ve:
                     print(f"Error clearing voices: {type(ve).__name__}: {ve}")
             
+            # Release the voice tensors shared between pipelines
+            try:
+                print(f"Cleared {clear_voice_cache()} cached voices")
+            except Exception as ce:
+                print(f"Error clearing voice cache: {type(ce).__name__}: {ce}")
+            
             # Clear model attributes that might hold tensors
             for attr_name in dir(model):
                 if not attr_name.startswith('__') and hasattr(model, attr_name):
@@ -392,6 +596,12 @@ def cleanup_resources():
             except Exception as ce:
                 print(f"Error clearing CUDA memory: {type(ce).__name__}: {ce}")
         
+        # Stop accepting new generation work
+        try:
+            _GENERATION_EXECUTOR.shutdown(wait=False)
+        except Exception as ge:
+            print(f"Error shutting down generation worker: {type(ge).__name__}: {ge}")
+        
         # Restore original functions
         try:
             from models import _cleanup_monkey_patches
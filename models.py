@@ -1,5 +1,5 @@
 """Models module for Kokoro TTS Local"""
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Dict
 import torch
 from kokoro import KPipeline
 import os
@@ -9,11 +9,29 @@ from pathlib import Path
 import numpy as np
 import shutil
 import threading
+import contextlib
+import logging
+import functools
+import copy
 
 # Set environment variables for proper encoding
 os.environ["PYTHONIOENCODING"] = "utf-8"
 # Disable symlinks warning
 os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
+# Per-segment and diagnostic output goes through this logger rather than print();
+# set KOKORO_LOG=DEBUG (or INFO) to see it
+logger = logging.getLogger("kokoro")
+try:
+    logger.setLevel(os.environ.get("KOKORO_LOG", "WARNING").upper())
+except ValueError:
+    logger.setLevel(logging.WARNING)
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_log_handler)
+    logger.propagate = False
+# Persist torch.compile artifacts so restarts skip most of the compile cost
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(".torchinductor_cache"))
 
 # Setup for safer monkey-patching
 import atexit
@@ -85,23 +103,137 @@ VOICE_FILES = [
     "pf_dora.pt", "pm_alex.pt", "pm_santa.pt"
 ]
 
-# Patch KPipeline's load_voice method to use weights_only=False
-original_load_voice = KPipeline.load_voice
+# Loaded voice tensors shared by every pipeline, keyed by (voice name, device)
+VOICE_CACHE: Dict[Tuple[str, str], torch.Tensor] = {}
+_voice_cache_lock = threading.Lock()
 
-def patched_load_voice(self, voice_path):
-    """Load voice model with weights_only=False for compatibility"""
-    if not os.path.exists(voice_path):
+# Optional safetensors support for memory-mapped voice loading
+try:
+    from safetensors.torch import load_file as load_safetensors, save_file as save_safetensors
+except ImportError:
+    load_safetensors = None
+    save_safetensors = None
+    print("Note: safetensors not installed, voices will be loaded with torch.load")
+
+# Key under which a voice tensor is stored in its .safetensors file
+SAFETENSORS_VOICE_KEY = "voice"
+
+def convert_voices_to_safetensors(voices_dir: str = "voices") -> int:
+    """Write a .safetensors copy next to every .pt voice file that lacks one
+
+    Voices with an up-to-date .safetensors copy are skipped, so this is cheap to
+    run on every startup. The .pt files are kept as the canonical voice list.
+
+    Args:
+        voices_dir: Directory containing the .pt voice files
+
+    Returns:
+        Number of voice files converted
+    """
+    if save_safetensors is None:
+        return 0
+    converted = 0
+    for pt_path in Path(os.path.abspath(voices_dir)).glob("*.pt"):
+        st_path = pt_path.with_suffix(".safetensors")
+        if st_path.exists() and st_path.stat().st_mtime >= pt_path.stat().st_mtime:
+            continue
+        try:
+            voice_model = torch.load(str(pt_path), weights_only=False, map_location="cpu")
+            save_safetensors({SAFETENSORS_VOICE_KEY: voice_model.contiguous()}, str(st_path))
+            converted += 1
+        except Exception as e:
+            print(f"Warning: Failed to convert {pt_path.name} to safetensors: {e}")
+            if st_path.exists():
+                st_path.unlink()
+    if converted:
+        print(f"Converted {converted} voice files to safetensors")
+    return converted
+
+def _normalize_device(device) -> str:
+    """Return a canonical device string so 'cuda' and 'cuda:0' map to the same key"""
+    device = torch.device(device)
+    if device.type == 'cuda' and device.index is None:
+        device = torch.device('cuda', torch.cuda.current_device())
+    return str(device)
+
+def _load_voice_tensor(voice_path, device: str) -> torch.Tensor:
+    """Load a voice tensor onto a device, reusing VOICE_CACHE when possible
+
+    A .safetensors copy next to the .pt file is preferred: it is memory-mapped
+    and loaded straight onto the device. The .pt file is the fallback.
+    """
+    st_path = Path(voice_path).with_suffix(".safetensors")
+    use_safetensors = load_safetensors is not None and st_path.exists()
+    if not use_safetensors and not os.path.exists(voice_path):
         raise FileNotFoundError(f"Voice file not found: {voice_path}")
-    voice_name = Path(voice_path).stem
-    try:
+    device = _normalize_device(device)
+    key = (Path(voice_path).stem, device)
+    with _voice_cache_lock:
+        cached = VOICE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    voice_model = None
+    if use_safetensors:
+        try:
+            voice_model = load_safetensors(str(st_path), device=device)[SAFETENSORS_VOICE_KEY]
+        except Exception as e:
+            print(f"Warning: Failed to load {st_path.name}, falling back to .pt: {e}")
+    if voice_model is None:
         voice_model = torch.load(voice_path, weights_only=False)
         if voice_model is None:
             raise ValueError(f"Failed to load voice model from {voice_path}")
-        # Ensure device is set
+    voice_model = voice_model.to(device, non_blocking=True)
+    with _voice_cache_lock:
+        # Another thread may have loaded the same voice meanwhile; keep the first one
+        return VOICE_CACHE.setdefault(key, voice_model)
+
+def preload_voices(voice_names: List[str], device: str) -> int:
+    """Load voices into VOICE_CACHE ahead of the first request
+
+    Args:
+        voice_names: Names of the voices to load (with or without .pt extension)
+        device: Device to use ('cuda' or 'cpu')
+
+    Returns:
+        Number of voices successfully loaded
+    """
+    loaded = 0
+    for voice_name in voice_names:
+        voice_path = os.path.abspath(os.path.join("voices", f"{voice_name.replace('.pt', '')}.pt"))
+        try:
+            _load_voice_tensor(voice_path, device)
+            loaded += 1
+        except Exception as e:
+            print(f"Warning: Failed to preload voice {voice_name}: {e}")
+    return loaded
+
+def clear_voice_cache() -> int:
+    """Drop all cached voice tensors and return how many were released"""
+    with _voice_cache_lock:
+        count = len(VOICE_CACHE)
+        VOICE_CACHE.clear()
+    return count
+
+# Patch KPipeline's load_voice method to use weights_only=False
+original_load_voice = KPipeline.load_voice
+
+def patched_load_voice(self, voice_path, *args, **kwargs):
+    """Load voice model with weights_only=False for compatibility
+
+    Voices are served from VOICE_CACHE after the first load, and preloaded
+    tensors can be passed in directly instead of a path.
+    """
+    if isinstance(voice_path, torch.Tensor):
+        return voice_path
+    voice_name = Path(voice_path).stem
+    try:
+        # Ensure device is set, preferring the device the model lives on
         if not hasattr(self, 'device'):
-            self.device = 'cpu'
-        # Move model to device and store in voices dictionary
-        self.voices[voice_name] = voice_model.to(self.device)
+            model = getattr(self, 'model', None)
+            self.device = str(model.device) if model is not None and hasattr(model, 'device') else 'cpu'
+        # Load (or reuse) the voice on the device and store in voices dictionary
+        self.voices[voice_name] = _load_voice_tensor(voice_path, self.device)
         return self.voices[voice_name]
     except Exception as e:
         print(f"Error loading voice {voice_name}: {e}")
@@ -321,6 +453,273 @@ def download_voice_files(voice_files=None, repo_version="main", required_count=1
 
     return downloaded_voices
 
+def split_text_segments(text: str) -> List[str]:
+    """Split text into the segments the pipeline synthesizes one at a time
+
+    Equivalent to KPipeline's default split_pattern=r'\n+' followed by its
+    skipping of blank segments, but uses str.split instead of the regex engine.
+
+    Args:
+        text: Text to split
+
+    Returns:
+        List of non-blank segments, in order
+    """
+    return [segment for segment in text.strip().split('\n') if segment.strip()]
+
+def to_pcm16(audio: np.ndarray) -> np.ndarray:
+    """Convert float audio in [-1, 1] to int16 PCM
+
+    Samples are rounded to the nearest integer (as libsndfile does) and values
+    outside the range are clipped. int16 input is returned unchanged.
+
+    Args:
+        audio: Float audio samples
+
+    Returns:
+        int16 PCM samples
+    """
+    if audio.dtype == np.int16:
+        return audio
+    return np.clip(np.rint(audio * 32767.0), -32768, 32767).astype(np.int16)
+
+def configure_torch_runtime(device: str) -> None:
+    """Tune PyTorch threading and backend flags for TTS-sized workloads
+
+    On CPU the thread pools are capped (4 threads by default, or
+    KOKORO_NUM_THREADS), since spreading small per-segment ops over every core
+    is slower than running them on a few. An explicit OMP_NUM_THREADS is left
+    alone. cuDNN autotuning is disabled because every segment has a different
+    length, and TF32 matmuls are allowed on CUDA.
+
+    Args:
+        device: Device to use ('cuda' or 'cpu')
+    """
+    torch.backends.cudnn.benchmark = False
+
+    if device == 'cuda':
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        return
+
+    if "OMP_NUM_THREADS" in os.environ and "KOKORO_NUM_THREADS" not in os.environ:
+        return
+    try:
+        num_threads = int(os.environ.get("KOKORO_NUM_THREADS", min(4, os.cpu_count() or 1)))
+    except ValueError:
+        print("Warning: Invalid KOKORO_NUM_THREADS, using 4")
+        num_threads = 4
+    num_threads = max(1, num_threads)
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before any inter-op parallel work has started
+        pass
+    print(f"Using {num_threads} CPU threads for inference")
+
+def compile_enabled(device: str) -> bool:
+    """Check whether torch.compile should be applied to the KModel
+
+    Enabled by default on CUDA and opt-in on CPU. Set KOKORO_COMPILE=1 to force
+    it on, or KOKORO_COMPILE=0 to disable it.
+    """
+    if not hasattr(torch, 'compile'):
+        return False
+    setting = os.environ.get("KOKORO_COMPILE", "").strip().lower()
+    if setting in ("0", "false", "no", "off"):
+        return False
+    if setting in ("1", "true", "yes", "on"):
+        return True
+    return device == 'cuda'
+
+def compile_pipeline_model(pipeline: KPipeline, device: str) -> KPipeline:
+    """Wrap the pipeline's KModel tensor forward in torch.compile
+
+    Only forward_with_tokens is compiled; KModel.forward does phoneme string
+    handling in Python and would graph-break on every call. Compilation is lazy,
+    so call warmup_pipeline() afterwards to pay the compile cost up front.
+
+    On CUDA, mode="reduce-overhead" captures the compiled regions into CUDA
+    graphs, so replays skip per-kernel launch overhead. KModel is not
+    autoregressive (the whole segment is decoded in one pass from predicted
+    durations), so there is no per-token decode loop or KV cache to capture.
+
+    Args:
+        pipeline: KPipeline instance whose model should be compiled
+        device: Device the model runs on ('cuda' or 'cpu')
+
+    Returns:
+        The same pipeline, for chaining
+    """
+    kmodel = getattr(pipeline, 'model', None)
+    if kmodel is None or not compile_enabled(device):
+        return pipeline
+    if getattr(kmodel, '_kokoro_eager_forward', None) is not None:
+        return pipeline  # Already compiled
+
+    try:
+        # CUDA graphs need a CUDA device; on CPU fall back to plain Inductor kernels
+        mode = "reduce-overhead" if device == 'cuda' and torch.cuda.is_available() else "default"
+        eager_forward = kmodel.forward_with_tokens
+        kmodel.forward_with_tokens = torch.compile(eager_forward, mode=mode, dynamic=True, fullgraph=False)
+        kmodel._kokoro_eager_forward = eager_forward
+        print(f"Compiled KModel with torch.compile (mode={mode})")
+    except Exception as e:
+        print(f"Warning: torch.compile unavailable, using eager model: {e}")
+    return pipeline
+
+# Maximum number of distinct segments remembered by each pipeline's G2P cache
+G2P_CACHE_SIZE = 4096
+
+# Short English phrases that show up often enough to be worth phonemizing at startup
+COMMON_PHRASES = [
+    "Hello.", "Hello!", "Hi.", "Hi there.", "Good morning.", "Good afternoon.",
+    "Good evening.", "Thank you.", "Thanks.", "Yes.", "No.", "Okay.",
+    "Please.", "Sorry.", "Welcome.", "Goodbye.", "How are you?", "Hello, world.",
+]
+
+def enable_g2p_cache(pipeline: KPipeline, maxsize: int = G2P_CACHE_SIZE) -> KPipeline:
+    """Memoize the pipeline's grapheme-to-phoneme (phonemizer) calls
+
+    The cache belongs to the pipeline, so entries are implicitly keyed by its
+    lang_code. English G2P returns mutable token objects, so every hit is
+    deep-copied before it is handed back to the pipeline.
+
+    Args:
+        pipeline: KPipeline instance whose g2p should be cached
+        maxsize: Maximum number of cached segments
+
+    Returns:
+        The same pipeline, for chaining
+    """
+    g2p = getattr(pipeline, 'g2p', None)
+    if g2p is None or getattr(pipeline, '_phonemize', None) is not None:
+        return pipeline
+
+    @functools.lru_cache(maxsize=maxsize)
+    def _phonemize(text: str):
+        return g2p(text)
+
+    def cached_g2p(text, *args, **kwargs):
+        if args or kwargs or not isinstance(text, str):
+            return g2p(text, *args, **kwargs)
+        return copy.deepcopy(_phonemize(text))
+
+    cached_g2p.cache_info = _phonemize.cache_info
+    cached_g2p.cache_clear = _phonemize.cache_clear
+    pipeline._phonemize = _phonemize
+    pipeline.g2p = cached_g2p
+    return pipeline
+
+def prime_g2p_cache(pipeline: KPipeline, phrases: List[str] = COMMON_PHRASES) -> int:
+    """Phonemize common phrases ahead of time so early requests hit the cache
+
+    Args:
+        pipeline: KPipeline instance with enable_g2p_cache() applied
+        phrases: Phrases to phonemize
+
+    Returns:
+        Number of phrases successfully phonemized
+    """
+    if getattr(pipeline, '_phonemize', None) is None:
+        return 0
+    primed = 0
+    for phrase in phrases:
+        try:
+            pipeline.g2p(phrase)
+            primed += 1
+        except Exception as e:
+            logger.debug("Failed to prime G2P cache with %r: %s", phrase, e)
+    return primed
+
+def restore_eager_model(pipeline: KPipeline) -> None:
+    """Undo compile_pipeline_model() and fall back to the eager forward"""
+    kmodel = getattr(pipeline, 'model', None)
+    eager_forward = getattr(kmodel, '_kokoro_eager_forward', None)
+    if eager_forward is not None:
+        kmodel.forward_with_tokens = eager_forward
+        kmodel._kokoro_eager_forward = None
+
+def warmup_pipeline(pipeline: KPipeline, voice_path: str, text: str = "Hello, this is a warmup.") -> bool:
+    """Run a short dummy generation so compilation happens before the first request
+
+    If the compiled model fails during warmup, the eager forward is restored so
+    user requests keep working.
+
+    Args:
+        pipeline: KPipeline instance to warm up
+        voice_path: Path to a voice file to use for the warmup
+        text: Short text to synthesize (roughly 16 tokens)
+
+    Returns:
+        True if warmup succeeded, False otherwise
+    """
+    try:
+        # Match the inference-mode/autocast state of real requests; otherwise the
+        # compiled graph's guards fail and the first request recompiles
+        model = getattr(pipeline, 'model', None)
+        device = str(getattr(model, 'device', getattr(pipeline, 'device', 'cpu')))
+        with inference_context(device):
+            for _ in pipeline(text, voice=voice_path, speed=1.0):
+                pass
+        return True
+    except Exception as e:
+        print(f"Warning: Pipeline warmup failed: {type(e).__name__}: {e}")
+        if getattr(getattr(pipeline, 'model', None), '_kokoro_eager_forward', None) is not None:
+            print("Falling back to eager model")
+            restore_eager_model(pipeline)
+        return False
+
+def get_autocast_dtype(device: str) -> Optional[torch.dtype]:
+    """Pick the reduced-precision dtype used for inference on this device
+
+    Inference runs in full FP32 unless KOKORO_PRECISION opts in to autocast:
+    'fp16', 'bf16', or 'auto' (BF16 on Ampere and newer, FP16 on older GPUs).
+    Reduced precision is experimental: autocast also lowers the decoder's
+    activations, which its iSTFT may not support. CPU always runs in FP32.
+
+    Args:
+        device: Device to use ('cuda' or 'cpu')
+
+    Returns:
+        Autocast dtype, or None to run in FP32
+    """
+    if torch.device(device).type != 'cuda' or not torch.cuda.is_available():
+        return None
+    setting = os.environ.get("KOKORO_PRECISION", "fp32").strip().lower()
+    if setting != "auto" and setting not in ("fp16", "bf16"):
+        return None
+    if setting == "fp16":
+        return torch.float16
+    if setting == "bf16":
+        return torch.bfloat16
+    try:
+        major, _ = torch.cuda.get_device_capability()
+    except (RuntimeError, AssertionError):
+        return None
+    return torch.bfloat16 if major >= 8 else torch.float16
+
+def inference_context(device: str) -> contextlib.ExitStack:
+    """Return a context manager for running generation
+
+    Combines torch.inference_mode() with CUDA autocast when get_autocast_dtype()
+    opts in to reduced precision. Pipelines are lazy generators, so wrap the
+    iteration, not just the call.
+
+    Args:
+        device: Device to use ('cuda' or 'cpu')
+
+    Returns:
+        Context manager to use in a with statement
+    """
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode())
+    dtype = get_autocast_dtype(device)
+    if dtype is not None:
+        stack.enter_context(torch.autocast(device_type='cuda', dtype=dtype))
+    return stack
+
 def build_model(model_path: str, device: str, repo_version: str = "main") -> KPipeline:
     """Build and return the Kokoro pipeline with proper encoding configuration
 
@@ -389,6 +788,9 @@ def build_model(model_path: str, device: str, repo_version: str = "main") -> KPi
                 print(f"Error: Voice files download failed: {e}")
                 raise ValueError("Voice files download failed") from e
 
+            # One-time conversion so later voice loads can use safetensors
+            convert_voices_to_safetensors()
+
             # Validate language code
             lang_code = 'a'  # 'a' for American English
             if lang_code not in ['a', 'b']:  # Simple validation of supported codes
@@ -403,6 +805,10 @@ def build_model(model_path: str, device: str, repo_version: str = "main") -> KPi
             # Store device parameter for reference in other operations
             pipeline_instance.device = device
 
+            # Compile the underlying KModel (warmed up later by the caller)
+            compile_pipeline_model(pipeline_instance, device)
+            enable_g2p_cache(pipeline_instance)
+
             # Initialize voices dictionary if it doesn't exist
             if not hasattr(pipeline_instance, 'voices'):
                 pipeline_instance.voices = {}
@@ -435,6 +841,12 @@ def build_model(model_path: str, device: str, repo_version: str = "main") -> KPi
 
         return _pipeline
 
+def release_pipeline() -> None:
+    """Drop the module's reference to the shared pipeline so it can be freed"""
+    global _pipeline
+    with _pipeline_lock:
+        _pipeline = None
+
 def list_available_voices() -> List[str]:
     """List all available voice models"""
     # Always use absolute path for consistency
@@ -570,20 +982,22 @@ def generate_speech(
                     raise ValueError(f"Failed to load voice {voice_name}: {e}")
 
         # Generate speech (outside the lock for better concurrency)
-        print(f"Generating speech with device: {model.device}")
+        logger.info("Generating speech with device: %s", model.device)
         generator = model(
-            text,
+            split_text_segments(text),
             voice=voice_path,
-            speed=speed,
-            split_pattern=r'\n+'
+            speed=speed
         )
 
-        # Get first generated segment and convert numpy array to tensor if needed
-        for gs, ps, audio in generator:
-            if audio is not None:
-                if isinstance(audio, np.ndarray):
-                    audio = torch.from_numpy(audio).float()
-                return audio, ps
+        # Get first generated segment and convert to a float32 CPU tensor if needed
+        with inference_context(model.device):
+            for gs, ps, audio in generator:
+                if audio is not None:
+                    if isinstance(audio, np.ndarray):
+                        audio = torch.from_numpy(audio)
+                    if audio.device.type != 'cpu' or audio.dtype != torch.float32:
+                        audio = audio.to('cpu', torch.float32)
+                    return audio, ps
 
         return None, None
     except (ValueError, FileNotFoundError, RuntimeError, KeyError, AttributeError, TypeError) as e:
@@ -1,6 +1,10 @@
 import torch
 from typing import Optional, Tuple, List, Union
-from models import build_model, generate_speech, list_available_voices
+from models import (
+    build_model, generate_speech, list_available_voices,
+    inference_context, configure_torch_runtime, split_text_segments,
+    logger, clear_voice_cache, release_pipeline, to_pcm16
+)
 from tqdm.auto import tqdm
 import soundfile as sf
 from pathlib import Path
@@ -42,6 +46,9 @@ DEFAULT_OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
 # Configure tqdm for better Windows console support
 tqdm.monitor_interval = 0
 
+# Inference only - never track gradients
+torch.set_grad_enabled(False)
+
 def print_menu():
     """Print the main menu options."""
     print("\n=== Kokoro TTS Menu ===")
@@ -118,61 +125,83 @@ def save_audio_with_retry(audio_data: np.ndarray, sample_rate: int, output_path:
         print(f"Warning: Could not remove existing file: {e}")
         print("This might indicate the file is in use by another program.")
 
-    for attempt in range(max_retries):
-        try:
-            # Validate audio data before saving
-            if audio_data is None or len(audio_data) == 0:
-                raise ValueError("Empty audio data")
+    # Write through a temporary file in chunks of about five seconds; a failed
+    # attempt keeps the chunks already written and the retry resumes after them
+    temp_path = output_path.with_name(f"temp_{output_path.name}")
+    chunk_frames = max(1, sample_rate * 5)
+    frames_written = 0
 
-            # Check write permissions for the directory
-            if not os.access(str(output_path.parent), os.W_OK):
-                raise PermissionError(f"No write permission for directory: {output_path.parent}")
+    try:
+        for attempt in range(max_retries):
+            try:
+                # Validate audio data before saving
+                if audio_data is None or len(audio_data) == 0:
+                    raise ValueError("Empty audio data")
 
-            # Try to use a temporary file first, then rename it
-            temp_path = output_path.with_name(f"temp_{output_path.name}")
+                # Check write permissions for the directory
+                if not os.access(str(output_path.parent), os.W_OK):
+                    raise PermissionError(f"No write permission for directory: {output_path.parent}")
 
-            # Save audio file to temporary location
-            print(f"Saving audio to temporary file: {temp_path}")
-            sf.write(str(temp_path), audio_data, sample_rate)
+                # Convert once so every chunk is written as 16-bit PCM
+                pcm = to_pcm16(audio_data)
 
-            # If successful, rename to final location
-            if temp_path.exists():
-                # Remove target file if it exists
-                if output_path.exists():
-                    output_path.unlink()
-                # Rename temp file to target file
-                temp_path.rename(output_path)
-                print(f"Successfully renamed temporary file to: {output_path}")
-
-            return True
-
-        except (IOError, PermissionError) as e:
-            if attempt < max_retries - 1:
-                print(f"\nFailed to save audio (attempt {attempt + 1}/{max_retries}): {e}")
-                print("The output file might be in use by another program (e.g., media player).")
-                print(f"Please close any programs that might be using '{output_path}'")
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                print(f"\nError: Could not save audio after {max_retries} attempts: {e}")
-                print(f"Please ensure '{output_path}' is not open in any other program and try again.")
-                print(f"You might need to restart your computer if the file remains locked.")
-                return False
-        except Exception as e:
-            print(f"\nUnexpected error saving audio: {type(e).__name__}: {e}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                return False
-        finally:
-            # Clean up temp file if it exists and we failed
-            try:
-                temp_path = output_path.with_name(f"temp_{output_path.name}")
+                resuming = frames_written > 0 and temp_path.exists()
+                if resuming:
+                    print(f"Resuming save at {frames_written / sample_rate:.1f}s: {temp_path}")
+                    audio_file = sf.SoundFile(str(temp_path), "r+")
+                else:
+                    frames_written = 0
+                    print(f"Saving audio to temporary file: {temp_path}")
+                    audio_file = sf.SoundFile(str(temp_path), "w", samplerate=sample_rate, channels=1,
+                                              format="WAV", subtype="PCM_16")
+
+                with audio_file:
+                    if resuming:
+                        # Drop anything written after the last complete chunk
+                        audio_file.truncate(frames_written)
+                        audio_file.seek(frames_written)
+                    while frames_written < len(pcm):
+                        chunk = pcm[frames_written:frames_written + chunk_frames]
+                        audio_file.write(chunk)
+                        frames_written += len(chunk)
+
+                # If successful, rename to final location
                 if temp_path.exists():
-                    temp_path.unlink()
-            except Exception:
-                pass
+                    # Remove target file if it exists
+                    if output_path.exists():
+                        output_path.unlink()
+                    # Rename temp file to target file
+                    temp_path.rename(output_path)
+                    print(f"Successfully renamed temporary file to: {output_path}")
+
+                return True
+
+            except (IOError, PermissionError) as e:
+                if attempt < max_retries - 1:
+                    print(f"\nFailed to save audio (attempt {attempt + 1}/{max_retries}): {e}")
+                    print("The output file might be in use by another program (e.g., media player).")
+                    print(f"Please close any programs that might be using '{output_path}'")
+                    print(f"Retrying in {retry_delay} seconds...")
+                    time.sleep(retry_delay)
+                else:
+                    print(f"\nError: Could not save audio after {max_retries} attempts: {e}")
+                    print(f"Please ensure '{output_path}' is not open in any other program and try again.")
+                    print(f"You might need to restart your computer if the file remains locked.")
+                    return False
+            except Exception as e:
+                print(f"\nUnexpected error saving audio: {type(e).__name__}: {e}")
+                if attempt < max_retries - 1:
+                    print(f"Retrying in {retry_delay} seconds...")
+                    time.sleep(retry_delay)
+                else:
+                    return False
+    finally:
+        # Clean up temp file if it exists and we failed
+        try:
+            if temp_path.exists():
+                temp_path.unlink()
+        except Exception:
+            pass
 
     return False
 
@@ -185,6 +214,7 @@ def main() -> None:
             print(f"CUDA initialization error: {e}. Using CPU instead.")
             device = 'cpu'  # Fallback if CUDA check fails
         print(f"Using device: {device}")
+        configure_torch_runtime(device)
 
         # Build model
         print("\nInitializing model...")
@@ -263,7 +293,7 @@ def main() -> None:
 
                     # Initialize generator
                     try:
-                        generator = model(text, voice=voice_path, speed=speed, split_pattern=r'\n+')
+                        generator = model(split_text_segments(text), voice=voice_path, speed=speed)
                     except (ValueError, TypeError, RuntimeError) as e:
                         print(f"Error initializing speech generator: {e}")
                         watchdog.cancel()
@@ -274,7 +304,7 @@ def main() -> None:
                         continue
 
                     # Process segments
-                    with tqdm(desc="Generating speech") as pbar:
+                    with tqdm(desc="Generating speech") as pbar, inference_context(device):
                         for gs, ps, audio in generator:
                             # Check overall timeout
                             current_time = time.time()
@@ -293,13 +323,19 @@ def main() -> None:
 
                             # Process audio if available
                             if audio is not None:
-                                # Only convert if it's a numpy array, not if already tensor
-                                audio_tensor = audio if isinstance(audio, torch.Tensor) else torch.from_numpy(audio).float()
-
-                                all_audio.append(audio_tensor)
-                                print(f"\nGenerated segment: {gs}")
-                                if ps:  # Only print phonemes if available
-                                    print(f"Phonemes: {ps}")
+                                # Keep segments as float32 NumPy arrays, since soundfile consumes NumPy;
+                                # autocast may return reduced precision, so cast only when needed
+                                if isinstance(audio, torch.Tensor):
+                                    if audio.device.type != 'cpu' or audio.dtype != torch.float32:
+                                        audio = audio.to('cpu', torch.float32)
+                                    audio_array = audio.numpy()
+                                else:
+                                    audio_array = np.asarray(audio, dtype=np.float32)
+
+                                all_audio.append(audio_array)
+                                logger.debug("Generated segment: %s", gs)
+                                if ps:  # Only log phonemes if available
+                                    logger.debug("Phonemes: %s", ps)
                                 pbar.update(1)
 
                     # Mark generation as complete (for watchdog)
@@ -331,14 +367,14 @@ def main() -> None:
                             final_audio = all_audio[0]
                         else:
                             try:
-                                final_audio = torch.cat(all_audio, dim=0)
-                            except RuntimeError as e:
+                                final_audio = np.concatenate(all_audio)
+                            except ValueError as e:
                                 print(f"Error concatenating audio segments: {e}")
                                 continue
 
                         # Use consistent Path object
                         output_path = Path(DEFAULT_OUTPUT_FILE)
-                        if save_audio_with_retry(final_audio.numpy(), SAMPLE_RATE, output_path):
+                        if save_audio_with_retry(final_audio, SAMPLE_RATE, output_path):
                             print(f"\nAudio saved to {output_path}")
                             # Play a system beep to indicate completion
                             try:
@@ -380,19 +416,15 @@ def main() -> None:
                     except Exception as voice_error:
                         print(f"Error clearing voice references: {voice_error}")
 
-                # Clear any other model attributes that might hold references
+                # Release the voice tensors shared between pipelines
                 try:
-                    for attr in list(model.__dict__.keys()):
-                        if hasattr(model, attr) and not attr.startswith('__'):
-                            try:
-                                delattr(model, attr)
-                            except:
-                                pass
-                except Exception as attr_error:
-                    print(f"Error clearing model attributes: {attr_error}")
+                    print(f"Cleared {clear_voice_cache()} cached voices")
+                except Exception as cache_error:
+                    print(f"Error clearing cached voices: {cache_error}")
 
-                # Then delete the model
+                # Then delete the model; gc.collect() and empty_cache() below free its memory
                 try:
+                    release_pipeline()
                     del model
                     model = None
                     print("Model reference deleted")
@@ -408,7 +440,15 @@ def main() -> None:
                 except Exception as cache_error:
                     print(f"Error clearing voice cache: {cache_error}")
 
-            # Clean up any CUDA resources
+            # Collect garbage first so released tensors are back in the caching allocator
+            try:
+                import gc
+                gc.collect()
+                print("Garbage collection completed")
+            except Exception as gc_error:
+                print(f"Error during garbage collection: {gc_error}")
+
+            # Then return the cached CUDA memory to the driver
             if torch.cuda.is_available():
                 try:
                     print("Cleaning up CUDA resources...")
@@ -425,14 +465,6 @@ def main() -> None:
             except Exception as patch_error:
                 print(f"Error restoring monkey patches: {patch_error}")
 
-            # Final garbage collection
-            try:
-                import gc
-                gc.collect()
-                print("Garbage collection completed")
-            except Exception as gc_error:
-                print(f"Error during garbage collection: {gc_error}")
-
             print("Cleanup completed")
 
         except Exception as e: